@@ -2,10 +2,15 @@ import os
 import re
 import json
 import asyncio
+import atexit
+import heapq
 import time
+from dataclasses import dataclass, fields, asdict, is_dataclass
 from datetime import datetime
+from html import escape
+from types import MappingProxyType
 from dotenv import load_dotenv
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from pyrogram.enums import ParseMode, ChatType
 from pyrogram.errors import (
@@ -14,10 +19,44 @@ from pyrogram.errors import (
 )
 from fastapi import FastAPI
 import uvicorn
-import threading
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Mapping
 import logging
 
+try:
+    import orjson
+
+    def json_dumps(data) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    def json_dumps_line(data) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+    json_loads = orjson.loads
+except ImportError:
+    def _json_default(obj):
+        if is_dataclass(obj):
+            return asdict(obj)
+        raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+    def json_dumps(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'),
+                          default=_json_default).encode('utf-8')
+
+    def json_dumps_line(data) -> bytes:
+        return json_dumps(data) + b'\n'
+
+    json_loads = json.loads
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -40,19 +79,32 @@ START_PHOTO_URL = os.environ.get(
 )
 SUPPORT_CHAT = os.environ.get("SUPPORT_CHAT", "https://t.me/+Y3SlUxZiUoc5MzNl")
 UPDATE_CHANNEL = os.environ.get("UPDATE_CHANNEL", "https://t.me/narzoxbot")
+PORT = int(os.environ.get("PORT", 8000))
+# Seconds to batch storage mutations before they are written to disk
+SAVE_DELAY = float(os.environ.get("SAVE_DELAY", 2))
+# Activity-only changes (last_seen, counters) are saved at most this often
+ACTIVITY_SAVE_INTERVAL = float(os.environ.get("ACTIVITY_SAVE_INTERVAL", 30))
+# Change-log records a file may collect before it is compacted into its JSON snapshot
+LOG_COMPACT_THRESHOLD = int(os.environ.get("LOG_COMPACT_THRESHOLD", 10000))
+# Below this many keywords, plain per-keyword matching beats the Aho-Corasick automaton
+SMALL_FILTER_SET = 100
 
 # Validate critical variables
 if not BOT_TOKEN or not API_ID or not API_HASH:
     raise ValueError("BOT_TOKEN, API_ID, and API_HASH are required!")
 
-ADMIN_IDS = []
+ADMIN_IDS = frozenset()
 try:
     admin_ids_str = os.environ.get("ADMIN_IDS", "7524032836")
     if admin_ids_str:
-        ADMIN_IDS = [int(uid.strip()) for uid in admin_ids_str.split(',') if uid.strip()]
+        ADMIN_IDS = frozenset(int(uid.strip()) for uid in admin_ids_str.split(',') if uid.strip())
 except ValueError as e:
     logger.error(f"Invalid ADMIN_IDS: {e}")
 
+# libuv-based event loop; must be set before the client grabs its loop
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 # Pyrogram Client
 app = Client(
     "filter_bot",
@@ -64,9 +116,47 @@ app = Client(
 )
 
 
+# First (up to) three word characters of every word in a message
+WORD_PREFIX_RE = re.compile(r'\b\w{1,3}')
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _at_word_boundary(text: str, index: int) -> bool:
+    """Same check as regex `\\b` at `index`"""
+    before = index > 0 and _is_word_char(text[index - 1])
+    after = index < len(text) and _is_word_char(text[index])
+    return before != after
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """A bot user; slotted to keep per-user memory low (orjson dumps it natively)"""
+    last_seen: float = 0.0
+    username: str = ''
+    first_name: str = ''
+    search_count: int = 0
+    join_date: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UserRecord':
+        return cls(**{name: data[name] for name in USER_FIELDS if name in data})
+
+
+USER_FIELDS = tuple(f.name for f in fields(UserRecord))
+
+
 # Storage System (JSON only for simplicity)
 class Storage:
-    """JSON-based storage system"""
+    """JSON-based storage system.
+
+    Filters, users and groups are persisted as a JSON snapshot plus an append-only
+    change log (`<name>.log.jsonl`) that is compacted back into the snapshot.
+    """
+    
+    LOGGED = ('local_filters', 'local_users', 'local_groups')
     
     def __init__(self):
         self.local_filters = {}
@@ -77,46 +167,189 @@ class Storage:
             "total_broadcasts": 0,
             "bot_started": time.time()
         }
+        self._files = {
+            'local_filters': JSON_FILTER_FILE,
+            'local_users': JSON_USER_FILE,
+            'local_groups': 'groups.json',
+            'local_stats': 'stats.json'
+        }
+        self._dirty = {}  # attr_name -> keys changed since the last flush
+        self._activity_dirty = {}
+        self._activity_saved_at = time.monotonic()
+        self._log_counts = dict.fromkeys(self.LOGGED, 0)
+        self._flush_task = None
+        # Keyword matcher state, rebuilt lazily after the filter set changes
+        self._matcher_dirty = True
+        self._automaton = None
+        self._patterns = {}
+        self._prefixes = None
         self._load_json()
+        self._filters_view = MappingProxyType(self.local_filters)
+        # Build the matcher at startup rather than on the first message
+        self._build_matcher()
+        # Running file count so stats never have to walk every filter
+        self._total_files = sum(len(v) for v in self.local_filters.values())
+        # Never lose the last batch of mutations on shutdown
+        atexit.register(self._flush_sync)
+
+    def _log_path(self, attr_name: str) -> str:
+        return os.path.splitext(self._files[attr_name])[0] + '.log.jsonl'
 
     def _load_json(self):
-        """Load data from JSON files"""
-        files_map = {
-            JSON_FILTER_FILE: 'local_filters',
-            JSON_USER_FILE: 'local_users',
-            'groups.json': 'local_groups',
-            'stats.json': 'local_stats'
-        }
-        
-        for filename, attr_name in files_map.items():
+        """Load data from JSON snapshots, then replay their change logs"""
+        for attr_name, filename in self._files.items():
             if os.path.exists(filename):
                 try:
-                    with open(filename, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                    with open(filename, 'rb') as f:
+                        data = json_loads(f.read())
                         if attr_name == 'local_stats':
                             # Ensure 'bot_started' is preserved if available
                             data['bot_started'] = data.get('bot_started', time.time())
                             self.local_stats.update(data)
+                        elif attr_name == 'local_users':
+                            # Users and groups are keyed by int ID in memory; JSON keys are strings
+                            self.local_users = {int(k): UserRecord.from_dict(v) for k, v in data.items()}
+                        elif attr_name == 'local_groups':
+                            self.local_groups = {int(k): v for k, v in data.items()}
                         else:
                             setattr(self, attr_name, data)
                 except Exception as e:
                     logger.error(f"Error loading {filename}: {e}")
 
-    def _save_json(self):
-        """Save data to JSON files"""
-        files_map = {
-            JSON_FILTER_FILE: self.local_filters,
-            JSON_USER_FILE: self.local_users,
-            'groups.json': self.local_groups,
-            'stats.json': self.local_stats
-        }
-        
-        for filename, data in files_map.items():
+        for attr_name in self.LOGGED:
+            if not self._replay_log(attr_name):
+                # Compact now so new appends don't land after a torn line
+                self._save_json([attr_name])
+
+    def _replay_log(self, attr_name: str) -> bool:
+        """Apply a change log on top of its snapshot; False if it had corrupt records"""
+        log_path = self._log_path(attr_name)
+        if not os.path.exists(log_path):
+            return True
+
+        data = getattr(self, attr_name)
+        clean = True
+        try:
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json_loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-append
+                        logger.warning(f"Skipping corrupt record in {log_path}")
+                        clean = False
+                        continue
+                    key = record['id']
+                    if record['op'] == 'del':
+                        data.pop(key, None)
+                    elif attr_name == 'local_users':
+                        data[key] = UserRecord.from_dict(record['data'])
+                    else:
+                        data[key] = record['data']
+                    self._log_counts[attr_name] += 1
+        except Exception as e:
+            logger.error(f"Error replaying {log_path}: {e}")
+        return clean
+
+    def _dump(self, attr_name: str) -> bytes:
+        return json_dumps(getattr(self, attr_name))
+
+    def _snapshot_job(self, attr_name: str):
+        log_path = None
+        if attr_name in self.LOGGED:
+            log_path = self._log_path(attr_name)
+            self._log_counts[attr_name] = 0
+        return 'snapshot', self._files[attr_name], self._dump(attr_name), log_path
+
+    def _log_job(self, attr_name: str, keys):
+        data = getattr(self, attr_name)
+        lines = [
+            json_dumps_line({'op': 'set', 'id': key, 'data': data[key]} if key in data
+                            else {'op': 'del', 'id': key})
+            for key in keys
+        ]
+        self._log_counts[attr_name] += len(lines)
+        return 'append', self._log_path(attr_name), b''.join(lines), None
+
+    def _prepare_writes(self, dirty: Dict[str, set], compact: bool = False) -> List[tuple]:
+        """Serialize dirty collections into write jobs (on the event loop, so data can't change mid-dump)"""
+        jobs = []
+        for attr_name, keys in dirty.items():
+            if compact or attr_name not in self.LOGGED \
+                    or self._log_counts[attr_name] + len(keys) > LOG_COMPACT_THRESHOLD:
+                jobs.append(self._snapshot_job(attr_name))
+            else:
+                jobs.append(self._log_job(attr_name, keys))
+        return jobs
+
+    @staticmethod
+    def _write_jobs(jobs: List[tuple]):
+        for kind, path, payload, log_path in jobs:
+            try:
+                if kind == 'append':
+                    with open(path, 'ab') as f:
+                        f.write(payload)
+                else:
+                    tmp_path = path + '.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        f.write(payload)
+                        # The data must be on disk before the rename, or a power loss
+                        # can leave an empty snapshot behind an already-truncated log
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                    if log_path:
+                        # Everything in the log is now part of the snapshot
+                        open(log_path, 'wb').close()
+            except Exception as e:
+                logger.error(f"Error saving {path}: {e}")
+
+    def _save_json(self, attr_names=None):
+        """Save full JSON snapshots (all of them unless `attr_names` is given), compacting their logs"""
+        self._write_jobs([self._snapshot_job(attr_name) for attr_name in (attr_names or self._files)])
+
+    def _mark_dirty(self, attr_name: str, key=None, activity_only: bool = False):
+        """Queue a changed record for the next batched save instead of writing it now.
+
+        Activity-only changes ride along with the next real save of the file and
+        force one at most every ACTIVITY_SAVE_INTERVAL seconds.
+        """
+        dirty = self._activity_dirty if activity_only else self._dirty
+        dirty.setdefault(attr_name, set()).add(key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(SAVE_DELAY)
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
+                await self.flush()
             except Exception as e:
-                logger.error(f"Error saving {filename}: {e}")
+                logger.error(f"Error flushing storage: {e}")
+
+    async def flush(self):
+        """Write all pending changes; serialization happens here, disk I/O in a thread"""
+        now = time.monotonic()
+        if now - self._activity_saved_at >= ACTIVITY_SAVE_INTERVAL:
+            ride_along = list(self._activity_dirty)
+        else:
+            ride_along = [attr_name for attr_name in self._activity_dirty if attr_name in self._dirty]
+        for attr_name in ride_along:
+            self._dirty.setdefault(attr_name, set()).update(self._activity_dirty.pop(attr_name))
+        if not self._activity_dirty:
+            self._activity_saved_at = now
+
+        dirty, self._dirty = self._dirty, {}
+        if dirty:
+            await asyncio.to_thread(self._write_jobs, self._prepare_writes(dirty))
+
+    def _flush_sync(self):
+        """Save pending changes at exit and compact every non-empty change log"""
+        pending = set(self._dirty) | set(self._activity_dirty)
+        pending.update(attr_name for attr_name, count in self._log_counts.items() if count)
+        if pending:
+            self._dirty, self._activity_dirty = {}, {}
+            self._save_json(pending)
 
     async def add_filter(self, keyword: str, file_data: dict):
         keyword = keyword.lower().strip()
@@ -124,66 +357,143 @@ class Storage:
         
         if keyword not in self.local_filters:
             self.local_filters[keyword] = []
+            self._matcher_dirty = True
         self.local_filters[keyword].append(file_data)
-        self._save_json()
+        self._total_files += 1
+        self._mark_dirty('local_filters', keyword)
+
+    @property
+    def filters_view(self) -> Mapping[str, List[Dict]]:
+        """Read-only live view of the filters, for synchronous hot-path reads"""
+        return self._filters_view
 
-    async def get_all_filters(self) -> Dict:
-        return self.local_filters
+    async def get_all_filters(self) -> Mapping[str, List[Dict]]:
+        return self._filters_view
 
     async def delete_filter(self, keyword: str) -> bool:
         keyword = keyword.lower().strip()
         if keyword in self.local_filters:
-            del self.local_filters[keyword]
-            self._save_json()
+            self._total_files -= len(self.local_filters.pop(keyword))
+            self._matcher_dirty = True
+            self._mark_dirty('local_filters', keyword)
             return True
         return False
 
+    def _build_matcher(self):
+        small = len(self.local_filters) < SMALL_FILTER_SET
+        # With only a few keywords the pre-filter costs more than it saves
+        self._prefixes = None if small else self._build_prefixes()
+        if ahocorasick is None or small:
+            # One precompiled word-boundary pattern per keyword: the fallback, and faster
+            # than the automaton while there are only a few keywords
+            self._automaton = None
+            self._patterns = {
+                keyword: re.compile(r'\b' + re.escape(keyword) + r'\b')
+                for keyword in self.local_filters if keyword
+            }
+        else:
+            self._patterns = {}
+            self._automaton = ahocorasick.Automaton()
+            for index, keyword in enumerate(self.local_filters):
+                if keyword:
+                    self._automaton.add_word(keyword, (index, keyword))
+            self._automaton.make_automaton()
+        self._matcher_dirty = False
+
+    def _build_prefixes(self) -> Optional[frozenset]:
+        """Word-start trigrams a message must contain for any keyword to match.
+
+        Returns None (no pre-filtering) if a keyword doesn't start with a word character.
+        """
+        prefixes = set()
+        for keyword in self.local_filters:
+            match = WORD_PREFIX_RE.match(keyword)
+            if not match:
+                return None
+            prefixes.add(match.group())
+        return frozenset(prefixes)
+
+    def match_keywords(self, text: str) -> List[str]:
+        """Keywords occurring in `text` as whole words (case-insensitive), in filter order"""
+        if not self.local_filters:
+            return []
+        text = text.lower()
+        if self._matcher_dirty:
+            self._build_matcher()
+
+        # Cheap rejection of chatter that can't contain any keyword
+        if self._prefixes is not None and self._prefixes.isdisjoint(WORD_PREFIX_RE.findall(text)):
+            return []
+
+        if self._automaton is None:
+            # Plain substring test (memchr-fast) before paying for the regex VM
+            return [
+                keyword for keyword, pattern in self._patterns.items()
+                if keyword in text and pattern.search(text)
+            ]
+
+        matched = set()
+        for end, (index, keyword) in self._automaton.iter(text):
+            if (index, keyword) not in matched \
+                    and _at_word_boundary(text, end - len(keyword) + 1) \
+                    and _at_word_boundary(text, end + 1):
+                matched.add((index, keyword))
+        return [keyword for _, keyword in sorted(matched)]
+
+    async def top_filters(self, limit: int) -> List[tuple]:
+        """(keyword, file count) for the `limit` largest filters, without sorting them all"""
+        return heapq.nlargest(
+            limit, ((keyword, len(files)) for keyword, files in self.local_filters.items()),
+            key=lambda item: item[1]
+        )
+
     async def search_filters(self, query: str) -> List[str]:
         query = query.lower().strip()
         return [k for k in self.local_filters.keys() if query in k]
 
-    async def add_user(self, user_id: int, user_data: Optional[Dict] = None):
-        user_id_str = str(user_id)
+    async def add_user(self, user_id: int, user_data: Optional[Dict] = None, searched: bool = False):
+        """Record a user's visit; `searched` also counts it as a search"""
         current_time = time.time()
+        username = user_data.get('username', '') if user_data else ''
+        first_name = user_data.get('first_name', '') if user_data else ''
         
-        existing_user = self.local_users.get(user_id_str, {})
+        existing_user = self.local_users.get(user_id)
         
-        user_info = {
-            'last_seen': current_time,
-            'username': user_data.get('username', '') if user_data else '',
-            'first_name': user_data.get('first_name', '') if user_data else '',
-            'search_count': existing_user.get('search_count', 0)
-        }
+        if existing_user is None:
+            self.local_users[user_id] = UserRecord(current_time, username, first_name, int(searched), current_time)
+            self._mark_dirty('local_users', user_id)
+            return
         
-        if user_id_str not in self.local_users:
-            user_info['join_date'] = current_time
-        else:
-            user_info['join_date'] = existing_user.get('join_date', current_time)
+        existing_user.last_seen = current_time
+        if searched:
+            existing_user.search_count += 1
+        # Repeat visit with an unchanged profile: activity only
+        if existing_user.username == username and existing_user.first_name == first_name:
+            self._mark_dirty('local_users', user_id, activity_only=True)
+            return
         
-        self.local_users[user_id_str] = user_info
-        self._save_json()
-
-    async def get_user_info(self, user_id: int) -> Optional[Dict]:
-        return self.local_users.get(str(user_id))
+        existing_user.username = username
+        existing_user.first_name = first_name
+        self._mark_dirty('local_users', user_id)
 
-    async def increment_user_search(self, user_id: int):
-        user_id_str = str(user_id)
-        if user_id_str in self.local_users:
-            self.local_users[user_id_str]['search_count'] = \
-                self.local_users[user_id_str].get('search_count', 0) + 1
-            self._save_json()
+    async def get_user_info(self, user_id: int) -> Optional[UserRecord]:
+        return self.local_users.get(user_id)
 
-    async def get_all_users(self) -> List[str]:
-        return list(self.local_users.keys())
+    async def get_all_users(self) -> List[int]:
+        return list(self.local_users)
 
     async def remove_user(self, user_id: int):
-        user_id_str = str(user_id)
-        if user_id_str in self.local_users:
-            del self.local_users[user_id_str]
-            self._save_json()
+        if user_id in self.local_users:
+            del self.local_users[user_id]
+            self._mark_dirty('local_users', user_id)
+
+    async def remove_users(self, user_ids):
+        """Remove many users at once, e.g. everyone who blocked the bot during a broadcast"""
+        for user_id in user_ids:
+            if self.local_users.pop(user_id, None) is not None:
+                self._mark_dirty('local_users', user_id)
 
     async def add_group(self, chat_id: int, chat_data: Dict):
-        chat_id_str = str(chat_id)
         current_time = time.time()
         
         group_info = {
@@ -193,28 +503,90 @@ class Storage:
             'last_active': current_time,
         }
         
-        if chat_id_str not in self.local_groups:
+        existing_group = self.local_groups.get(chat_id)
+        if existing_group and all(
+            existing_group.get(key) == group_info[key] for key in ('title', 'username', 'members_count')
+        ):
+            existing_group['last_active'] = current_time
+            self._mark_dirty('local_groups', chat_id, activity_only=True)
+            return
+        
+        if chat_id not in self.local_groups:
             group_info['join_date'] = current_time
         else:
-            group_info['join_date'] = self.local_groups[chat_id_str].get('join_date', current_time)
+            group_info['join_date'] = self.local_groups[chat_id].get('join_date', current_time)
         
-        self.local_groups[chat_id_str] = group_info
-        self._save_json()
+        self.local_groups[chat_id] = group_info
+        self._mark_dirty('local_groups', chat_id)
 
-    async def get_all_groups(self) -> List[str]:
-        return list(self.local_groups.keys())
+    async def get_all_groups(self) -> List[int]:
+        return list(self.local_groups)
 
     async def increment_stat(self, stat_name: str):
         self.local_stats[stat_name] = self.local_stats.get(stat_name, 0) + 1
-        self._save_json()
+        self._mark_dirty('local_stats', activity_only=True)
 
     async def get_stats(self) -> Dict:
-        return self.local_stats
+        """Counters plus collection sizes, without copying out any IDs"""
+        return {
+            **self.local_stats,
+            'total_users': len(self.local_users),
+            'total_groups': len(self.local_groups),
+            'total_filters': len(self.local_filters),
+            'total_files': self._total_files,
+        }
 
 
 STORAGE = Storage()
 
 
+class TokenBucket:
+    """Async token bucket that paces outgoing messages across all handlers"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self._rate = rate
+        self._capacity = capacity or rate
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Hold every sender for `seconds`, then restart empty.
+
+        Only for bot-wide FloodWaits (broadcast); a per-chat FloodWait must not stall other chats.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._last = self._paused_until
+
+    async def take(self):
+        """Wait until a message may be sent"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self._capacity, self._tokens + max(0.0, now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+# Telegram allows bots ~30 messages/second overall; stay a little below that.
+# Every send and edit goes through paced(); a small burst keeps one chat from getting them all.
+SEND_BUCKET = TokenBucket(25, capacity=5)
+
+
+async def paced(send, *args, **kwargs):
+    """Call a Telegram send/edit method once SEND_BUCKET allows it; every outgoing message goes through here"""
+    await SEND_BUCKET.take()
+    return await send(*args, **kwargs)
+
+
 # Custom filter for admin
 def is_admin(_, __, message: Message):
     return message.from_user and message.from_user.id in ADMIN_IDS
@@ -222,24 +594,69 @@ def is_admin(_, __, message: Message):
 admin_only = filters.create(is_admin)
 
 
+# Commands that must never be treated as a keyword search
+BOT_COMMANDS = frozenset({
+    "start", "help", "stats", "ping", "addfilter",
+    "delfilter", "listfilters", "broadcast", "myinfo"
+})
+
+
+async def is_bot_command(_, __, message: Message):
+    text = message.text
+    if not text or not text.startswith('/'):
+        return False
+    command = text[1:].split(None, 1)[0] if text[1:2].strip() else ''
+    return command.split('@', 1)[0].lower() in BOT_COMMANDS
+
+bot_command = filters.create(is_bot_command)
+
+
+# Keyboards are immutable, so build them once and share them between handlers
+BACK_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🏠 Back", callback_data="back_to_start")]
+])
+
+STATS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats")]
+])
+
+_start_keyboard: Optional[InlineKeyboardMarkup] = None
+
+
+def get_start_keyboard(client: Client) -> InlineKeyboardMarkup:
+    """Main menu keyboard; built on first use since it needs the bot's username"""
+    global _start_keyboard
+    if _start_keyboard is None:
+        _start_keyboard = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("📚 Commands", callback_data="help_commands"),
+                InlineKeyboardButton("ℹ️ About", callback_data="about_info")
+            ],
+            [
+                InlineKeyboardButton("📊 My Stats", callback_data="user_stats")
+            ],
+            [
+                InlineKeyboardButton("➕ Add Me To Group ➕", 
+                                   url=f"http://t.me/{client.me.username}?startgroup=true")
+            ],
+            [
+                InlineKeyboardButton("💬 Support", url=f"https://t.me/+Y3SlUxZiUoc5MzNl"),
+                InlineKeyboardButton("📢 Updates", url=f"https://t.me/narzoxbot")
+            ]
+        ])
+    return _start_keyboard
+
+
 # Start Command
-@app.on_message(filters.command("start"))
-async def start_command(client: Client, message: Message):
-    if message.chat.type == ChatType.PRIVATE:
-        user_data = {
-            'username': message.from_user.username or '',
-            'first_name': message.from_user.first_name or '',
-        }
-        await STORAGE.add_user(message.chat.id, user_data)
-    
-    caption = f"""
+# Message templates are built once; HTML is cheaper for Pyrogram to parse than Markdown
+START_CAPTION = """
 ╔═══❰ 🎭 TEAM NARZO ANIME BOT 🎭 ❱═══╗
 
-**👋 HEY {message.from_user.first_name}!**
+<b>👋 HEY {first_name}!</b>
 
-**🌟 WELCOME TO ADVANCED AUTO-FILTER BOT! 🌟**
+<b>🌟 WELCOME TO ADVANCED AUTO-FILTER BOT! 🌟</b>
 
-**⚡ FEATURES ⚡**
+<b>⚡ FEATURES ⚡</b>
 ━━━━━━━━━━━━━━━━━━━━
 ✨ Lightning Fast Search
 🎯 Smart Auto-Filter
@@ -248,95 +665,111 @@ async def start_command(client: Client, message: Message):
 🛡️ 24/7 Support
 ━━━━━━━━━━━━━━━━━━━━
 
-**💎 ADD ME TO YOUR GROUP! 💎**
+<b>💎 ADD ME TO YOUR GROUP! 💎</b>
+
+<b>🔗 MAINTAINED BY:</b> <a href="https://t.me/teamrajweb">TEAM NARZO</a>
 
-**🔗 MAINTAINED BY:** [TEAM NARZO](https://t.me/teamrajweb)
+╚═══════════════════════════╝
+"""
+
+MENU_CAPTION = """
+╔═══❰ 🎭 TEAM NARZO BOT 🎭 ❱═══╗
+
+<b>👋 Welcome {first_name}!</b>
+
+Use buttons below to navigate.
 
 ╚═══════════════════════════╝
 """
+
+
+@app.on_message(filters.command("start"))
+async def start_command(client: Client, message: Message):
+    if message.chat.type == ChatType.PRIVATE:
+        user_data = {
+            'username': message.from_user.username or '',
+            'first_name': message.from_user.first_name or '',
+        }
+        await STORAGE.add_user(message.chat.id, user_data)
     
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("📚 Commands", callback_data="help_commands"),
-            InlineKeyboardButton("ℹ️ About", callback_data="about_info")
-        ],
-        [
-            InlineKeyboardButton("📊 My Stats", callback_data="user_stats")
-        ],
-        [
-            InlineKeyboardButton("➕ Add Me To Group ➕", 
-                               url=f"http://t.me/{client.me.username}?startgroup=true")
-        ],
-        [
-            InlineKeyboardButton("💬 Support", url=f"https://t.me/+Y3SlUxZiUoc5MzNl"),
-            InlineKeyboardButton("📢 Updates", url=f"https://t.me/narzoxbot")
-        ]
-    ])
+    caption = START_CAPTION.format(first_name=escape(message.from_user.first_name or ''))
+    
+    keyboard = get_start_keyboard(client)
 
     try:
-        await client.send_photo(
+        await paced(client.send_photo,
             chat_id=message.chat.id,
             photo=START_PHOTO_URL,
             caption=caption,
             reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN
+            parse_mode=ParseMode.HTML
         )
     except Exception as e:
         logger.error(f"Error sending photo: {e}")
-        await message.reply_text(
+        await paced(message.reply_text,
             caption,
             reply_markup=keyboard,
             disable_web_page_preview=True,
-            parse_mode=ParseMode.MARKDOWN
+            parse_mode=ParseMode.HTML
         )
 
 
 # Stats Command
-@app.on_message(filters.command("stats") & admin_only)
-async def stats_handler(client: Client, message: Message):
-    users = await STORAGE.get_all_users()
-    groups = await STORAGE.get_all_groups()
-    filters_dict = await STORAGE.get_all_filters()
-    stats = await STORAGE.get_stats()
-    
-    uptime = time.time() - stats.get('bot_started', time.time())
-    uptime_str = time.strftime('%H:%M:%S', time.gmtime(uptime))
-    
-    stats_msg = f"""
+STATS_TEMPLATE = """
 ╔═══❰ 📊 BOT STATISTICS 📊 ❱═══╗
 
-**👥 USER STATS:**
+<b>👥 USER STATS:</b>
 ━━━━━━━━━━━━━━━━━━
-• **Total Users:** `{len(users)}`
-• **Total Groups:** `{len(groups)}`
+• <b>Total Users:</b> <code>{total_users}</code>
+• <b>Total Groups:</b> <code>{total_groups}</code>
 
-**📁 CONTENT STATS:**
+<b>📁 CONTENT STATS:</b>
 ━━━━━━━━━━━━━━━━━━
-• **Total Filters:** `{len(filters_dict)}`
-• **Total Files:** `{sum(len(v) for v in filters_dict.values())}`
-• **Total Searches:** `{stats.get('total_searches', 0)}`
+• <b>Total Filters:</b> <code>{total_filters}</code>
+• <b>Total Files:</b> <code>{total_files}</code>
+• <b>Total Searches:</b> <code>{total_searches}</code>
 
-**⚙️ SYSTEM INFO:**
+<b>⚙️ SYSTEM INFO:</b>
 ━━━━━━━━━━━━━━━━━━
-• **Storage:** `JSON`
-• **Uptime:** `{uptime_str}`
-• **Broadcasts:** `{stats.get('total_broadcasts', 0)}`
+• <b>Storage:</b> <code>JSON</code>
+• <b>Uptime:</b> <code>{uptime}</code>
+• <b>Broadcasts:</b> <code>{total_broadcasts}</code>
 
 ╚════════════════════════════╝
 """
+
+
+async def build_stats_message():
+    stats = await STORAGE.get_stats()
+    
+    uptime = time.time() - stats.get('bot_started', time.time())
+    uptime_str = time.strftime('%H:%M:%S', time.gmtime(uptime))
     
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_stats")]
-    ])
+    stats_msg = STATS_TEMPLATE.format_map({**stats, 'uptime': uptime_str})
     
-    await message.reply_text(stats_msg, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+    return stats_msg, STATS_KEYBOARD
+
+
+@app.on_message(filters.command("stats") & admin_only)
+async def stats_handler(client: Client, message: Message):
+    stats_msg, keyboard = await build_stats_message()
+    await paced(message.reply_text, stats_msg, reply_markup=keyboard, parse_mode=ParseMode.HTML)
 
 
 # Ping Command
+PING_TEMPLATE = (
+    "╔═══❰ 🏓 PONG! 🏓 ❱═══╗\n\n"
+    "{emoji} <b>Latency:</b> <code>{latency} ms</code>\n"
+    "📶 <b>Status:</b> <code>{status}</code>\n"
+    "💾 <b>Storage:</b> <code>JSON</code>\n\n"
+    "╚═══════════════════════╝"
+)
+
+
 @app.on_message(filters.command("ping"))
 async def ping_handler(client: Client, message: Message):
     start_time = time.time()
-    sent_message = await message.reply_text("🏓 **Pinging...**")
+    sent_message = await paced(message.reply_text, "🏓 <b>Pinging...</b>", parse_mode=ParseMode.HTML)
     end_time = time.time()
     
     latency = round((end_time - start_time) * 1000)
@@ -348,73 +781,99 @@ async def ping_handler(client: Client, message: Message):
     else:
         emoji, status = "🔴", "Poor"
     
-    await sent_message.edit_text(
-        f"╔═══❰ 🏓 PONG! 🏓 ❱═══╗\n\n"
-        f"{emoji} **Latency:** `{latency} ms`\n"
-        f"📶 **Status:** `{status}`\n"
-        f"💾 **Storage:** `JSON`\n\n"
-        f"╚═══════════════════════╝",
-        parse_mode=ParseMode.MARKDOWN
+    await paced(sent_message.edit_text,
+        PING_TEMPLATE.format(emoji=emoji, latency=latency, status=status),
+        parse_mode=ParseMode.HTML
     )
 
 
 # Broadcast
+BROADCAST_CONCURRENCY = 25  # copies in flight at once
+BROADCAST_PROGRESS_INTERVAL = 3  # seconds between progress edits
+
+
 @app.on_message(filters.command("broadcast") & admin_only & filters.reply)
 async def broadcast_handler(client: Client, message: Message):
     replied_msg = message.reply_to_message
     if not replied_msg:
-        return await message.reply_text("❌ Reply to a message to broadcast")
+        return await paced(message.reply_text, "❌ Reply to a message to broadcast")
         
-    status_msg = await message.reply_text("📡 **Starting broadcast...**", parse_mode=ParseMode.MARKDOWN)
+    status_msg = await paced(message.reply_text, "📡 <b>Starting broadcast...</b>", parse_mode=ParseMode.HTML)
     
     user_ids = await STORAGE.get_all_users()
     total = len(user_ids)
     success, failed, removed = 0, 0, 0
     start_time = time.time()
+    pending = iter(user_ids)
+    blocked: List[int] = []  # removed together once the broadcast is done
     
-    update_interval = max(1, total // 20)
+    async def send_one(user_id: int):
+        nonlocal success, failed, removed
+        # One retry after a FloodWait, then give up on this user
+        for _ in range(2):
+            try:
+                await paced(replied_msg.copy, user_id)
+                success += 1
+                return
+                
+            except (UserIsBlocked, PeerIdInvalid):
+                blocked.append(user_id)
+                removed += 1
+                failed += 1
+                return
+                
+            except FloodWait as e:
+                # Stop every sender, not just this one; the retry's take() waits it out
+                SEND_BUCKET.pause(e.value)
+                
+            except Exception:
+                failed += 1
+                return
+        failed += 1
     
-    for idx, user_id_str in enumerate(user_ids, 1):
-        try:
-            await replied_msg.copy(int(user_id_str))
-            success += 1
-            await asyncio.sleep(0.05)
-            
-        except (UserIsBlocked, PeerIdInvalid):
-            await STORAGE.remove_user(int(user_id_str))
-            removed += 1
-            failed += 1
-            
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            
-        except Exception:
-            failed += 1
-        
-        if idx % update_interval == 0 or idx == total:
-            progress = (idx / total) * 100
+    async def worker():
+        # Workers share one iterator, so a slow user never holds up the rest
+        for user_id in pending:
+            await send_one(user_id)
+    
+    async def report_progress():
+        last_text = None
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            progress = ((success + failed) / total) * 100
+            text = (
+                f"📡 <b>Broadcasting:</b> <code>{progress:.1f}%</code>\n"
+                f"✅ Sent: <code>{success}</code> | ❌ Failed: <code>{failed}</code>"
+            )
+            # Nothing moved (e.g. everyone is waiting out a FloodWait): skip the edit
+            if text == last_text:
+                continue
             try:
-                await status_msg.edit_text(
-                    f"📡 **Broadcasting:** `{progress:.1f}%`\n"
-                    f"✅ Sent: `{success}` | ❌ Failed: `{failed}`",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                await paced(status_msg.edit_text, text, parse_mode=ParseMode.HTML)
+                last_text = text
             except MessageNotModified:
-                pass
+                last_text = text
             except Exception:
                 pass
     
+    progress_task = asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(*(worker() for _ in range(BROADCAST_CONCURRENCY)))
+    finally:
+        progress_task.cancel()
+        await STORAGE.remove_users(blocked)
+    
     duration = round(time.time() - start_time, 2)
     await STORAGE.increment_stat('total_broadcasts')
     
-    await status_msg.edit_text(
+    await paced(status_msg.edit_text,
         f"╔═══❰ ✅ BROADCAST COMPLETE ❱═══╗\n\n"
-        f"• **Sent:** `{success}` 🟢\n"
-        f"• **Failed:** `{failed}` 🔴\n"
-        f"• **Removed:** `{removed}` 🗑️\n"
-        f"• **Time:** `{duration}s`\n\n"
+        f"• <b>Sent:</b> <code>{success}</code> 🟢\n"
+        f"• <b>Failed:</b> <code>{failed}</code> 🔴\n"
+        f"• <b>Removed:</b> <code>{removed}</code> 🗑️\n"
+        f"• <b>Time:</b> <code>{duration}s</code>\n\n"
         f"╚════════════════════════════╝",
-        parse_mode=ParseMode.MARKDOWN
+        parse_mode=ParseMode.HTML
     )
 
 
@@ -422,9 +881,9 @@ async def broadcast_handler(client: Client, message: Message):
 @app.on_message(filters.command("addfilter") & admin_only & filters.reply)
 async def add_filter_handler(client: Client, message: Message):
     if len(message.command) < 2:
-        return await message.reply_text(
-            "**Usage:** `/addfilter <keyword>`\n**Note:** Reply to a message",
-            parse_mode=ParseMode.MARKDOWN
+        return await paced(message.reply_text,
+            "<b>Usage:</b> <code>/addfilter &lt;keyword&gt;</code>\n<b>Note:</b> Reply to a message",
+            parse_mode=ParseMode.HTML
         )
 
     keyword = " ".join(message.command[1:]).strip()
@@ -448,11 +907,11 @@ async def add_filter_handler(client: Client, message: Message):
     
     await STORAGE.add_filter(keyword, file_data)
     
-    await message.reply_text(
-        f"✅ **Filter Added**\n\n"
-        f"**Keyword:** `{keyword}`\n"
-        f"**Type:** `{file_type}`",
-        parse_mode=ParseMode.MARKDOWN
+    await paced(message.reply_text,
+        f"✅ <b>Filter Added</b>\n\n"
+        f"<b>Keyword:</b> <code>{escape(keyword)}</code>\n"
+        f"<b>Type:</b> <code>{file_type}</code>",
+        parse_mode=ParseMode.HTML
     )
 
 
@@ -460,50 +919,124 @@ async def add_filter_handler(client: Client, message: Message):
 @app.on_message(filters.command("delfilter") & admin_only)
 async def del_filter_handler(client: Client, message: Message):
     if len(message.command) < 2:
-        return await message.reply_text("**Usage:** `/delfilter <keyword>`", parse_mode=ParseMode.MARKDOWN)
+        return await paced(message.reply_text, "<b>Usage:</b> <code>/delfilter &lt;keyword&gt;</code>", parse_mode=ParseMode.HTML)
 
     keyword = " ".join(message.command[1:]).strip()
     
     if await STORAGE.delete_filter(keyword):
-        await message.reply_text(f"✅ Filter `{keyword}` deleted!", parse_mode=ParseMode.MARKDOWN)
+        await paced(message.reply_text, f"✅ Filter <code>{escape(keyword)}</code> deleted!", parse_mode=ParseMode.HTML)
     else:
-        await message.reply_text(f"❌ Filter `{keyword}` not found!", parse_mode=ParseMode.MARKDOWN)
+        await paced(message.reply_text, f"❌ Filter <code>{escape(keyword)}</code> not found!", parse_mode=ParseMode.HTML)
 
 
 # List Filters
 @app.on_message(filters.command("listfilters") & admin_only)
 async def list_filters_handler(client: Client, message: Message):
-    all_filters = await STORAGE.get_all_filters()
+    stats = await STORAGE.get_stats()
     
-    if not all_filters:
-        return await message.reply_text("🚫 No filters found!")
+    if not stats['total_filters']:
+        return await paced(message.reply_text, "🚫 No filters found!")
 
-    sorted_filters = sorted(all_filters.items(), key=lambda x: len(x[1]), reverse=True)
-    
+    top_filters = await STORAGE.top_filters(50)
     filters_list = "\n".join(
-        f"**{i+1}.** `{k}` - {len(v)} files"
-        for i, (k, v) in enumerate(sorted_filters[:50])
+        f"<b>{i+1}.</b> <code>{escape(k)}</code> - {count} files"
+        for i, (k, count) in enumerate(top_filters)
     )
     
-    total_files = sum(len(v) for v in all_filters.values())
-    
-    await message.reply_text(
-        f"📚 **FILTER LIST**\n\n"
-        f"**Total Keywords:** `{len(all_filters)}`\n"
-        f"**Total Files:** `{total_files}`\n\n"
+    await paced(message.reply_text,
+        f"📚 <b>FILTER LIST</b>\n\n"
+        f"<b>Total Keywords:</b> <code>{stats['total_filters']}</code>\n"
+        f"<b>Total Files:</b> <code>{stats['total_files']}</code>\n\n"
         f"{filters_list}",
-        parse_mode=ParseMode.MARKDOWN
+        parse_mode=ParseMode.HTML
     )
 
 
+# Group info (title, member count) changes slowly; record each group at most this often (seconds)
+GROUP_REFRESH_INTERVAL = 3600
+_group_refreshed: Dict[int, tuple] = {}  # chat_id -> (monotonic time, member count)
+
+
+async def refresh_group(client: Client, chat):
+    """Store a group's info, but skip the get_chat round-trip and the write for recently seen groups"""
+    now = time.monotonic()
+    cached = _group_refreshed.get(chat.id)
+    if cached and now - cached[0] < GROUP_REFRESH_INTERVAL:
+        return
+    previous_count = cached[1] if cached else 0
+    # Claim the slot first so a burst of messages doesn't fetch the chat repeatedly
+    _group_refreshed[chat.id] = (now, previous_count)
+
+    try:
+        # Use client.get_chat to get member count, which is more reliable
+        chat_info = await client.get_chat(chat.id)
+        member_count = chat_info.members_count if chat_info.members_count else 0
+    except Exception:
+        member_count = previous_count
+
+    _group_refreshed[chat.id] = (now, member_count)
+    await STORAGE.add_group(chat.id, {
+        'title': chat.title or '',
+        'username': chat.username or '',
+        'members_count': member_count
+    })
+
+
+async def fetch_reply_markups(client: Client, files: List[Dict]) -> Dict[tuple, Optional[InlineKeyboardMarkup]]:
+    """Buttons of the original filter messages, fetched with one get_messages call per source chat.
+
+    Keys are (chat_id, message_id); files whose source chat couldn't be read are left out.
+    """
+    message_ids: Dict[int, List[int]] = {}
+    for file_data in files:
+        ids = message_ids.setdefault(file_data["chat_id"], [])
+        if file_data["message_id"] not in ids:
+            ids.append(file_data["message_id"])
+
+    async def fetch(source_chat_id: int, ids: List[int]):
+        # get_messages waits out FloodWaits itself, so any error here is final
+        try:
+            messages = await client.get_messages(chat_id=source_chat_id, message_ids=ids)
+        except Exception as e:
+            logger.error(f"Skipping {len(ids)} filter file(s) from {source_chat_id}, fetch failed: {e}")
+            return []
+        return [((source_chat_id, msg_id), msg.reply_markup) for msg_id, msg in zip(ids, messages)]
+
+    results = await asyncio.gather(*(fetch(source_chat_id, ids) for source_chat_id, ids in message_ids.items()))
+    return {key: markup for pairs in results for key, markup in pairs}
+
+
+async def send_filter_file(client: Client, chat_id: int, keyword: str, file_data: Dict,
+                           reply_markup: Optional[InlineKeyboardMarkup]):
+    # One retry after a FloodWait, then give up on this file
+    for _ in range(2):
+        try:
+            # Copy the message, including the original's reply_markup (buttons) if present
+            await paced(client.copy_message,
+                chat_id=chat_id,
+                from_chat_id=file_data["chat_id"],
+                message_id=file_data["message_id"],
+                reply_markup=reply_markup
+            )
+            return
+        
+        except FloodWait as e:
+            # Per-chat limit (~20 messages/minute in groups): only this chat waits
+            logger.warning(f"FloodWait in {chat_id}: waiting {e.value}s")
+            await asyncio.sleep(e.value)
+        except MessageDeleteForbidden:
+            logger.warning(f"Filter message {file_data['message_id']} deleted/unavailable in {file_data['chat_id']}. Skipping.")
+            return
+        except Exception as e:
+            logger.error(f"Error copying message for filter '{keyword}': {e}")
+            return
+
+
 # Keyword Matching Handler (FIXED)
 @app.on_message(
     filters.text & 
     (filters.private | filters.group) &
-    ~filters.command([
-        "start", "help", "stats", "ping", "addfilter", 
-        "delfilter", "listfilters", "broadcast", "myinfo"
-    ])
+    ~bot_command
 )
 async def keyword_match_handler(client: Client, message: Message):
     # Ignore edited messages
@@ -516,173 +1049,217 @@ async def keyword_match_handler(client: Client, message: Message):
             'username': message.from_user.username or '',
             'first_name': message.from_user.first_name or '',
         }
-        await STORAGE.add_user(message.chat.id, user_data)
-        await STORAGE.increment_user_search(message.chat.id)
+        await STORAGE.add_user(message.chat.id, user_data, searched=True)
         
     elif message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
-        try:
-            # Use client.get_chat to get member count, which is more reliable
-            chat_info = await client.get_chat(message.chat.id)
-            member_count = chat_info.members_count if chat_info.members_count else 0
-        except Exception:
-            member_count = 0
-
-        chat_data = {
-            'title': message.chat.title or '',
-            'username': message.chat.username or '',
-            'members_count': member_count
-        }
-        await STORAGE.add_group(message.chat.id, chat_data)
-    
-    text = message.text.lower()
-    all_filters = await STORAGE.get_all_filters()
-    matched_keywords = []
+        await refresh_group(client, message.chat)
     
-    # Smart matching
-    for keyword in all_filters.keys():
-        if not keyword:
-            continue
-            
-        # Use word boundaries for more accurate matching
-        regex = r'\b' + re.escape(keyword) + r'\b'
-        if re.search(regex, text):
-            matched_keywords.append(keyword)
+    all_filters = STORAGE.filters_view
+    # Smart matching: one automaton pass with word boundaries
+    matched_keywords = STORAGE.match_keywords(message.text)
     
     if matched_keywords:
         await STORAGE.increment_stat('total_searches')
         
         # Limit the number of keywords and files to prevent spam/flood
-        for keyword in matched_keywords[:5]:
-            files = all_filters.get(keyword, [])
-            
-            for file_data in files[:10]:
-                try:
-                    # FIX: Fetch the original message to get the reply_markup (buttons)
-                    original_message = await client.get_messages(
-                        chat_id=file_data["chat_id"],
-                        message_ids=file_data["message_id"]
-                    )
-                    
-                    # Copy the message, including the reply_markup if present
-                    await client.copy_message(
-                        chat_id=message.chat.id,
-                        from_chat_id=file_data["chat_id"],
-                        message_id=file_data["message_id"],
-                        reply_markup=original_message.reply_markup  # <-- FIX APPLIED HERE
-                    )
-                    
-                    await asyncio.sleep(0.5)
-                
-                except FloodWait as e:
-                    logger.warning(f"FloodWait: sleeping for {e.value}s")
-                    await asyncio.sleep(e.value)
-                except MessageDeleteForbidden:
-                    logger.warning(f"Filter message {file_data['message_id']} deleted/unavailable in {file_data['chat_id']}. Skipping.")
-                except Exception as e:
-                    logger.error(f"Error copying message for filter '{keyword}': {e}")
+        wanted = [
+            (keyword, file_data)
+            for keyword in matched_keywords[:5]
+            for file_data in all_filters.get(keyword, [])[:10]
+        ]
+        markups = await fetch_reply_markups(client, [file_data for _, file_data in wanted])
+        
+        # One after another so results arrive in order; other chats are served concurrently
+        for keyword, file_data in wanted:
+            key = (file_data["chat_id"], file_data["message_id"])
+            if key in markups:
+                await send_filter_file(client, message.chat.id, keyword, file_data, markups[key])
+
+
+HELP_TEXT = """
+📚 <b>BOT COMMANDS</b>
+
+<b>User Commands:</b>
+• <code>/start</code> - Start bot
+• <code>/ping</code> - Check latency
+• <code>/myinfo</code> - Your stats
+
+<b>Admin Commands:</b>
+• <code>/addfilter &lt;keyword&gt;</code> - Add filter (Reply to message)
+• <code>/delfilter &lt;keyword&gt;</code> - Delete filter
+• <code>/listfilters</code> - List filters
+• <code>/broadcast</code> - Broadcast message (Reply to message)
+• <code>/stats</code> - Bot statistics
+"""
+
+ABOUT_TEMPLATE = """
+ℹ️ <b>ABOUT BOT</b>
+
+<b>Statistics:</b>
+• Users: <code>{total_users}</code>
+• Groups: <code>{total_groups}</code>
+• Storage: <code>JSON</code>
+
+<b>Developer:</b> TEAM NARZO
+<b>Support:</b> <a href="https://t.me/+Y3SlUxZiUoc5MzNl">Support Chat</a>
+"""
+
+USER_STATS_TEMPLATE = """
+📊 <b>YOUR STATISTICS</b>
+
+<b>Name:</b> {name}
+<b>User ID:</b> <code>{user_id}</code>
+<b>Searches:</b> <code>{searches}</code>
+<b>Joined:</b> <code>{joined}</code>
+"""
+
+
+# Help Command: send the commands panel directly instead of a button that opens it
+@app.on_message(filters.command("help"))
+async def help_handler(client: Client, message: Message):
+    await paced(message.reply_text, HELP_TEXT, reply_markup=BACK_KEYBOARD, parse_mode=ParseMode.HTML)
 
 
 # Callback Handler
+async def show_help(client: Client, callback_query: CallbackQuery):
+    await paced(callback_query.edit_message_text,
+        HELP_TEXT,
+        reply_markup=BACK_KEYBOARD,
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def show_menu(client: Client, callback_query: CallbackQuery):
+    caption = MENU_CAPTION.format(first_name=escape(callback_query.from_user.first_name or ''))
+    await paced(callback_query.edit_message_text,
+        caption,
+        reply_markup=get_start_keyboard(client),
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def show_about(client: Client, callback_query: CallbackQuery):
+    stats = await STORAGE.get_stats()
+    
+    about_text = ABOUT_TEMPLATE.format_map(stats)
+    
+    await paced(callback_query.edit_message_text,
+        about_text,
+        reply_markup=BACK_KEYBOARD,
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True
+    )
+
+
+async def show_user_stats(client: Client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    user_info = await STORAGE.get_user_info(user_id)
+    
+    if user_info:
+        join_date = datetime.fromtimestamp(user_info.join_date or time.time())
+        
+        stats_text = USER_STATS_TEMPLATE.format(
+            name=escape(callback_query.from_user.first_name or ''),
+            user_id=user_id,
+            searches=user_info.search_count,
+            joined=join_date.strftime('%d %b %Y')
+        )
+    else:
+        stats_text = "❌ <b>No stats found!</b> Send /start first."
+
+    await paced(callback_query.edit_message_text,
+        stats_text,
+        reply_markup=BACK_KEYBOARD,
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def refresh_stats(client: Client, callback_query: CallbackQuery):
+    stats_msg, keyboard = await build_stats_message()
+    await paced(callback_query.edit_message_text,
+        stats_msg,
+        reply_markup=keyboard,
+        parse_mode=ParseMode.HTML
+    )
+
+
+# callback_data -> panel handler
+CALLBACK_HANDLERS = {
+    "help_commands": show_help,
+    "back_to_start": show_menu,
+    "about_info": show_about,
+    "user_stats": show_user_stats,
+    "refresh_stats": refresh_stats,
+}
+ADMIN_CALLBACKS = frozenset({"refresh_stats"})
+
+
 @app.on_callback_query()
 async def callback_handler(client: Client, callback_query: CallbackQuery):
     data = callback_query.data
-    user_id = callback_query.from_user.id
     
-    try:
-        if data == "help_commands":
-            help_text = """
-📚 **BOT COMMANDS**
-
-**User Commands:**
-• `/start` - Start bot
-• `/ping` - Check latency
-• `/myinfo` - Your stats
-
-**Admin Commands:**
-• `/addfilter <keyword>` - Add filter (Reply to message)
-• `/delfilter <keyword>` - Delete filter
-• `/listfilters` - List filters
-• `/broadcast` - Broadcast message (Reply to message)
-• `/stats` - Bot statistics
-"""
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("🏠 Back", callback_data="back_to_start")]
-            ])
-            
-            await callback_query.edit_message_text(
-                help_text,
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN
-            )
+    handler = CALLBACK_HANDLERS.get(data)
+    if handler is None:
+        return await callback_query.answer("❌ Invalid action!", show_alert=True)
+    if data in ADMIN_CALLBACKS and callback_query.from_user.id not in ADMIN_IDS:
+        return await callback_query.answer("❌ Admins only!", show_alert=True)
+    
+    # The panel edit and the answer are independent RPCs, so overlap them
+    edited, answered = await asyncio.gather(
+        handler(client, callback_query), callback_query.answer(), return_exceptions=True
+    )
+    for result in (edited, answered):
+        if isinstance(result, Exception) and not isinstance(result, MessageNotModified):
+            logger.error(f"Callback error ({data}): {result}")
 
-        elif data == "back_to_start":
-            caption = f"""
-╔═══❰ 🎭 TEAM NARZO BOT 🎭 ❱═══╗
 
-**👋 Welcome {callback_query.from_user.first_name}!**
+# FastAPI health server (keeps web hosts like Render happy)
+api = FastAPI()
 
-Use buttons below to navigate.
 
-╚═══════════════════════════╝
-"""
-            keyboard = InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("📚 Commands", callback_data="help_commands"),
-                    InlineKeyboardButton("ℹ️ About", callback_data="about_info")
-                ],
-                [InlineKeyboardButton("📊 My Stats", callback_data="user_stats")],
-                 [
-                    InlineKeyboardButton("➕ Add Me To Group ➕", 
-                                       url=f"http://t.me/{client.me.username}?startgroup=true")
-                ],
-                [
-                    InlineKeyboardButton("💬 Support", url=f"https://t.me/+Y3SlUxZiUoc5MzNl"),
-                    InlineKeyboardButton("📢 Updates", url=f"https://t.me/narzoxbot")
-                ]
-            ])
-            
-            await callback_query.edit_message_text(
-                caption,
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN
-            )
+@api.get("/")
+async def root():
+    return {"status": "running", "bot": "Filter Bot"}
 
-        elif data == "about_info":
-            users = await STORAGE.get_all_users()
-            groups = await STORAGE.get_all_groups()
-            
-            about_text = f"""
-ℹ️ **ABOUT BOT**
 
-**Statistics:**
-• Users: `{len(users)}`
-• Groups: `{len(groups)}`
-• Storage: `JSON`
+@api.get("/stats")
+async def api_stats():
+    stats = await STORAGE.get_stats()
+    return {
+        "users": stats['total_users'],
+        "groups": stats['total_groups'],
+        "filters": stats['total_filters'],
+        "files": stats['total_files']
+    }
 
-**Developer:** TEAM NARZO
-**Support:** [Support Chat](https://t.me/+Y3SlUxZiUoc5MzNl)
-"""
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("🏠 Back", callback_data="back_to_start")]
-            ])
-            
-            await callback_query.edit_message_text(
-                about_text,
-                reply_markup=keyboard,
-                parse_mode=ParseMode.MARKDOWN,
-                disable_web_page_preview=True
-            )
 
-        elif data == "user_stats":
-            user_info = await STORAGE.get_user_info(user_id)
-            
-            if user_info:
-                join_date = datetime.fromtimestamp(user_info.get('join_date', time.time()))
-                
-                stats_text = f"""
-📊 **YOUR STATISTICS**
+async def serve_api(api_server: uvicorn.Server):
+    """Run the API server; if it dies (e.g. the port is taken) the bot keeps running"""
+    try:
+        await api_server.serve()
+    except (Exception, SystemExit) as e:  # uvicorn calls sys.exit(1) when it can't bind
+        logger.error(f"API server stopped: {e!r}")
+
+
+async def main():
+    """Run the bot and the API server side by side on one event loop"""
+    api_server = uvicorn.Server(uvicorn.Config(api, host="0.0.0.0", port=PORT, log_level="warning"))
+    # Pyrogram's idle() owns SIGINT/SIGTERM for the whole process
+    api_server.install_signal_handlers = lambda: None
+
+    await app.start()
+    try:
+        api_task = asyncio.create_task(serve_api(api_server))
+        logger.info("🚀 Bot started!")
+
+        await idle()
+
+        api_server.should_exit = True
+        await api_task
+    finally:
+        await app.stop()
+
 
-**Name:** {callback_query.from_user.first_name}
-**User ID:** `{user_id}
+if __name__ == "__main__":
+    logger.info("🚀 Bot starting...")
+    app.run(main())